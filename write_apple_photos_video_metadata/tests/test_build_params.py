@@ -0,0 +1,46 @@
+from pathlib import Path
+from write_apple_photos_video_metadata import (
+    VIDEO_TAG_ARGS,
+    XMP_TAG_ARGS,
+    build_params,
+)
+
+RENDERED_VIDEO_PATH = Path("./Output/C0001.mp4")
+SRC_VIDEO_PATH = Path("./Selects/C0001.MP4")
+SRC_XMP_PATH = Path("./Selects/C0001.XMP")
+
+
+def test_only_video_source():
+    """Only a source video -> Copy the video tags"""
+    params = build_params(RENDERED_VIDEO_PATH, SRC_VIDEO_PATH, None)
+    assert params == [
+        "-TagsFromFile",
+        SRC_VIDEO_PATH,
+        *VIDEO_TAG_ARGS,
+        RENDERED_VIDEO_PATH,
+    ]
+
+
+def test_only_xmp_source():
+    """Only an XMP sidecar -> Copy the XMP tags"""
+    params = build_params(RENDERED_VIDEO_PATH, None, SRC_XMP_PATH)
+    assert params == [
+        "-TagsFromFile",
+        SRC_XMP_PATH,
+        *XMP_TAG_ARGS,
+        RENDERED_VIDEO_PATH,
+    ]
+
+
+def test_video_and_xmp_sources():
+    """Both sources -> Video tags, then XMP tags, then the rendered video"""
+    params = build_params(RENDERED_VIDEO_PATH, SRC_VIDEO_PATH, SRC_XMP_PATH)
+    assert params == [
+        "-TagsFromFile",
+        SRC_VIDEO_PATH,
+        *VIDEO_TAG_ARGS,
+        "-TagsFromFile",
+        SRC_XMP_PATH,
+        *XMP_TAG_ARGS,
+        RENDERED_VIDEO_PATH,
+    ]
@@ -0,0 +1,28 @@
+from pathlib import Path
+from write_apple_photos_video_metadata import _find_selects_dir
+
+
+def test_output_dir():
+    """Rendered videos in Output/ -> Selects/ beside Output/"""
+    output_dir = Path("/Shoot/Output")
+    assert _find_selects_dir(output_dir) == Path("/Shoot/Selects")
+
+
+def test_nested_output_dir():
+    """Rendered videos in a subdirectory of Output/ -> Selects/ beside Output/"""
+    output_dir = Path("/Shoot/Output/hevc/web")
+    assert _find_selects_dir(output_dir) == Path("/Shoot/Selects")
+
+
+def test_output_archive_dir():
+    """OutputArchive/ isn't Output/ -> Selects/ inside OutputArchive/"""
+    output_dir = Path("/Shoot/OutputArchive")
+    assert _find_selects_dir(output_dir) == Path(
+        "/Shoot/OutputArchive/Selects"
+    )
+
+
+def test_no_output_dir():
+    """No Output/ in the path -> Selects/ inside the video's directory"""
+    output_dir = Path("/Shoot/Renders")
+    assert _find_selects_dir(output_dir) == Path("/Shoot/Renders/Selects")
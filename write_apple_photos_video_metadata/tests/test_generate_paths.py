@@ -0,0 +1,70 @@
+from pathlib import Path
+from write_apple_photos_video_metadata import (
+    RENDER_PRESET_SUFFIX,
+    generate_paths,
+)
+
+
+def make_shoot(tmp_path, src_names):
+    """Create a shoot with one rendered video and the given source files"""
+    selects_dir = tmp_path / "Selects"
+    selects_dir.mkdir()
+    for name in src_names:
+        (selects_dir / name).touch()
+    output_dir = tmp_path / "Output"
+    output_dir.mkdir()
+    rendered_video_path = output_dir / f"C0001{RENDER_PRESET_SUFFIX}.mp4"
+    rendered_video_path.touch()
+    return rendered_video_path, selects_dir
+
+
+def test_video_and_xmp(tmp_path):
+    """Source video and XMP sidecar -> Both paths"""
+    rendered_video_path, selects_dir = make_shoot(
+        tmp_path, ["C0001.mp4", "C0001.xmp"]
+    )
+    src_video_path, src_xmp_path = generate_paths(rendered_video_path)
+    assert src_video_path == selects_dir / "C0001.mp4"
+    assert src_xmp_path == selects_dir / "C0001.xmp"
+
+
+def test_case_insensitive_extensions(tmp_path):
+    """Source files found regardless of extension case, with their real names"""
+    rendered_video_path, selects_dir = make_shoot(
+        tmp_path, ["C0001.MP4", "C0001.XMP"]
+    )
+    src_video_path, src_xmp_path = generate_paths(rendered_video_path)
+    assert src_video_path == selects_dir / "C0001.MP4"
+    assert src_xmp_path == selects_dir / "C0001.XMP"
+
+
+def test_only_xmp(tmp_path):
+    """No source video -> None for the video path"""
+    rendered_video_path, selects_dir = make_shoot(tmp_path, ["C0001.xmp"])
+    src_video_path, src_xmp_path = generate_paths(rendered_video_path)
+    assert src_video_path is None
+    assert src_xmp_path == selects_dir / "C0001.xmp"
+
+
+def test_xmp_named_dir(tmp_path):
+    """Directory named like a source file -> Not a source file"""
+    rendered_video_path, selects_dir = make_shoot(tmp_path, ["C0001.mp4"])
+    (selects_dir / "C0001.xmp").mkdir()
+    src_video_path, src_xmp_path = generate_paths(rendered_video_path)
+    assert src_video_path == selects_dir / "C0001.mp4"
+    assert src_xmp_path is None
+
+
+def test_missing_selects_dir(tmp_path):
+    """No Selects directory -> No source files"""
+    rendered_video_path, selects_dir = make_shoot(tmp_path, [])
+    selects_dir.rmdir()
+    assert generate_paths(rendered_video_path) == (None, None)
+
+
+def test_selects_not_a_dir(tmp_path):
+    """Selects is a file -> No source files"""
+    rendered_video_path, selects_dir = make_shoot(tmp_path, [])
+    selects_dir.rmdir()
+    selects_dir.touch()
+    assert generate_paths(rendered_video_path) == (None, None)
@@ -12,11 +12,48 @@ Write Apple Photos compatible video metadata from original files to transcoded c
 - GPS coordinates, if available
 """
 
+import functools
+import math
+import multiprocessing
+import os
 from pathlib import Path
+import tempfile
 
 import exiftool
 
 
+# Appended to rendered video filenames by the export preset
+RENDER_PRESET_SUFFIX = "-optimized-hevc-12mbps-vbr-multipass"
+
+# Tags to copy from each source file, following its -TagsFromFile
+VIDEO_TAG_ARGS = (
+    "-XML:DeviceManufacturer>Keys:Make",
+    "-XML:DeviceModelName>Keys:Model",
+)
+XMP_TAG_ARGS = (
+    "-All",
+    "-CreateDate>Keys:CreationDate",
+    "-GPSPosition>Keys:GPSCoordinates",
+)
+
+# Arguments appended to every command by exiftool itself (-common_args), so
+# they aren't repeated in each file's block of the argfile. -G and -n are
+# pyexiftool's defaults.
+# -fast skips scanning to the end of the source files for trailers. Not
+# -fast2: it stops at the mdat atom, and Sony MP4s store the moov atom (with
+# the XML device info) after mdat.
+COMMON_ARGS = ["-G", "-n", "-fast"]
+
+# Set to True to write to the rendered videos without creating "_original"
+# backups, which double the bytes written per file. Off by default, following
+# exiftool's standard practice of keeping backups.
+OVERWRITE_ORIGINALS = False
+# Overwrite with -overwrite_original_in_place instead, which keeps the original
+# file's inode, extended attributes, and macOS Finder info (tags, creation
+# date). It's slower: exiftool writes a temporary file and then copies it back
+# over the original.
+OVERWRITE_IN_PLACE = False
+
 files = [
     Path("..."),
     Path("..."),
@@ -24,59 +61,155 @@ files = [
 ]
 
 
+def _find_selects_dir(output_dir: Path) -> Path:
+    """Find the Selects directory for a directory of rendered videos"""
+    # Climb up until we're out of the output directory. Compare whole path
+    # components so e.g. OutputArchive/ isn't mistaken for Output/.
+    parts = output_dir.parts
+    if "Output" in parts:
+        output_dir = Path(*parts[: parts.index("Output")])
+    return output_dir / "Selects"
+
+
+@functools.lru_cache(maxsize=None)
+def _index_dir(src_dir: Path) -> dict[str, os.DirEntry]:
+    """Map lowercased filenames to directory entries for files in src_dir
+
+    Cached, so each Selects directory is listed once rather than checking for
+    every source file individually.
+    """
+    try:
+        with os.scandir(src_dir) as entries:
+            return {e.name.lower(): e for e in entries if e.is_file()}
+    except OSError:
+        # Missing, not a directory, or unreadable. No source files either way.
+        return {}
+
+
 def generate_paths(rendered_video_path: Path):
-    src_video_name = Path(
-        rendered_video_path.name.replace(
-            "-optimized-hevc-12mbps-vbr-multipass", ""
-        )
-    ).with_suffix(".MP4")
-    parents = list(rendered_video_path.resolve().parents)
-    for p in parents:
-        # Climb up until we're out of the output directory
-        if "/Output" not in str(p):
-            src_dir = p / "Selects"
-            break
-    src_video_path = src_dir / src_video_name
-    if not src_video_path.is_file:
-        src_video_path = None
-    src_xmp_path = src_dir / src_video_name.with_suffix(".xmp")
-    if not src_xmp_path.is_file:
-        src_xmp_path = None
+    src_video_stem = rendered_video_path.stem.removesuffix(
+        RENDER_PRESET_SUFFIX
+    )
+    # absolute() rather than resolve(), which would readlink every path
+    # component. Assumes the Output tree isn't reached through a symlink
+    # placed between the session folder and its Output folder.
+    src_dir = _find_selects_dir(rendered_video_path.absolute().parent)
+    src_files = _index_dir(src_dir)
+    src_video_entry = src_files.get(f"{src_video_stem}.mp4".lower())
+    src_video_path = Path(src_video_entry.path) if src_video_entry else None
+    src_xmp_entry = src_files.get(f"{src_video_stem}.xmp".lower())
+    src_xmp_path = Path(src_xmp_entry.path) if src_xmp_entry else None
     return src_video_path, src_xmp_path
 
 
-def write_apple_photos_metadata(
+def build_params(
     rendered_video_path: Path,
     src_video_path: Path | None,
     src_xmp_path: Path | None,
-):
-    with exiftool.ExifToolHelper() as et:
-        params = []
+) -> list:
+    """Build the exiftool arguments to copy metadata to one rendered video"""
+    params = []
+    if src_video_path:
+        params.extend(("-TagsFromFile", src_video_path, *VIDEO_TAG_ARGS))
+    if src_xmp_path:
+        params.extend(("-TagsFromFile", src_xmp_path, *XMP_TAG_ARGS))
+    params.append(rendered_video_path)
+    return params
+
+
+def write_apple_photos_metadata(
+    jobs: list[tuple[Path, Path | None, Path | None]],
+    et: exiftool.ExifToolHelper,
+) -> bool:
+    """Copy metadata to all rendered videos with a single exiftool command
+
+    jobs are (rendered_video_path, src_video_path, src_xmp_path) tuples. Each
+    file gets its own block of arguments in an argfile, separated by -execute,
+    so exiftool reads the whole batch in one go. exiftool only returns the exit
+    status of the last block, so every block also lists files giving errors in
+    an error file (-efile).
+
+    Returns False if any rendered video couldn't be written.
+    """
+    blocks = []
+    for rendered_video_path, src_video_path, src_xmp_path in jobs:
         if not (src_video_path or src_xmp_path):
             print("No source files to copy metadata from")
             print(rendered_video_path.name)
-            return
-        if src_video_path:
-            params.append("-TagsFromFile")
-            params.append(src_video_path)
-            params.append("-XML:DeviceManufacturer>Keys:Make")
-            params.append("-XML:DeviceModelName>Keys:Model")
-        if src_xmp_path:
-            params.append("-TagsFromFile")
-            params.append(src_xmp_path)
-            params.append("-All")
-            params.append("-CreateDate>Keys:CreationDate")
-            params.append("-GPSPosition>Keys:GPSCoordinates")
-        params.append(rendered_video_path)
+            continue
         print(f"Writing metadata to {rendered_video_path.name}")
-        result = et.execute(*params)
-        print(result)
-        # print(et.execute("-G0:1", "-s2", "-a", "-sort", rendered_video_path))
+        blocks.append(
+            build_params(rendered_video_path, src_video_path, src_xmp_path)
+        )
+    if not blocks:
+        return True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        argfile_path = Path(tmp_dir) / "write_metadata.args"
+        errfile_path = Path(tmp_dir) / "errors.txt"
+        with argfile_path.open("w", encoding="utf-8") as argfile:
+            for i, params in enumerate(blocks):
+                # -execute separates commands. The last command is run by
+                # exiftool itself at the end of the arguments.
+                if i > 0:
+                    argfile.write("-execute\n")
+                params = ["-efile", errfile_path, *params]
+                argfile.writelines(f"{p}\n" for p in params)
+
+        try:
+            result = et.execute("-@", argfile_path)
+            ok = True
+        except exiftool.exceptions.ExifToolExecuteError as e:
+            result = e.stdout
+            ok = False
+        # In stay_open mode, exiftool prints {ready} after each inner -execute
+        lines = result.splitlines()
+        print("\n".join(line for line in lines if line != "{ready}"))
+
+        error_files = []
+        if errfile_path.is_file():
+            error_files = errfile_path.read_text(encoding="utf-8").splitlines()
+
+    for error_file in error_files:
+        print(f"Error writing metadata to {error_file}")
+    if ok and not error_files:
+        return True
+    if not error_files:
+        print("Batch failed, file unknown")
+    print(f"{et.last_status=}")
+    print(f"{et.last_stderr=}")
+    return False
+
+
+def process_chunk(jobs: list[tuple[Path, Path | None, Path | None]]) -> bool:
+    """Write metadata for a chunk of jobs with this worker's own exiftool
+
+    Returns False if any rendered video couldn't be written.
+    """
+    common_args = list(COMMON_ARGS)
+    if OVERWRITE_ORIGINALS:
+        if OVERWRITE_IN_PLACE:
+            common_args.append("-overwrite_original_in_place")
+        else:
+            common_args.append("-overwrite_original")
+    with exiftool.ExifToolHelper(common_args=common_args) as et:
+        return write_apple_photos_metadata(jobs, et)
+
+
+def chunk_list(items: list, size: int) -> list[list]:
+    """Split items into consecutive chunks of at most size items"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
 
 
 if __name__ == "__main__":
-    for rendered_video_path in files:
-        src_video_path, src_xmp_path = generate_paths(rendered_video_path)
-        write_apple_photos_metadata(
-            rendered_video_path, src_video_path, src_xmp_path
-        )
+    jobs = [(p, *generate_paths(p)) for p in files]
+    # Worker startup isn't worth it for a couple of files
+    if len(jobs) <= 2:
+        chunks_ok = [process_chunk(jobs)]
+    else:
+        processes = min(os.cpu_count() or 1, len(jobs))
+        chunk_size = math.ceil(len(jobs) / processes)
+        with multiprocessing.Pool(processes=processes) as pool:
+            chunks_ok = pool.map(process_chunk, chunk_list(jobs, chunk_size))
+    if not all(chunks_ok):
+        raise SystemExit(1)
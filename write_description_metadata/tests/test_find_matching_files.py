@@ -145,4 +145,18 @@ def test_return_variable_structure(images_template, tmp_path):
             assert mutated_image.found_file_path == file_to_find
         else:
             assert mutated_image.found_file_path is None
- 
\ No newline at end of file
+
+
+def test_empty_images_skips_search(tmp_path):
+    """With no images to match, return without scanning any files"""
+    search_dir = tmp_path / "photos"
+    search_dir.mkdir()
+    for i in range(1, 6):
+        (search_dir / f"file{i}.JPG").write_text("")
+    images = find_matching_files(
+        search_dir=search_dir,
+        images={},
+        ignore_jpg=False,
+        max_scan_items=1,
+    )
+    assert images == {}
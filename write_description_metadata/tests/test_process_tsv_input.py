@@ -1,3 +1,4 @@
+import csv
 from pathlib import Path
 import pytest
 from write_description_metadata import Image, process_tsv_input
@@ -45,6 +46,49 @@ def test_input_extra_fields():
         process_tsv_input(input)
 
 
+@pytest.mark.parametrize(
+    "line",
+    [
+        "IMG_0001.ARW\t",
+        "IMG_0001.ARW\t   ",
+        "\tDescription",
+        "   \tDescription",
+    ],
+)
+def test_input_empty_field(line):
+    """Abort on an empty filename or description"""
+    with pytest.raises(ValueError):
+        process_tsv_input([line])
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "IMG_0001.ARW\tDescription\t",
+        "\tIMG_0001.ARW\tDescription",
+        "  IMG_0001.ARW\tDescription \t \n",
+    ],
+)
+def test_input_surrounding_whitespace(line):
+    """Ignore whitespace, including tabs, around the line"""
+    images = process_tsv_input([line])
+    img = images["IMG_0001"]
+    assert img.input_file_path == Path("IMG_0001.ARW")
+    assert img.input_desc == "Description"
+
+
+def test_input_unparseable_line(capsys):
+    """Abort on lines the csv reader can't parse"""
+    input = [
+        "IMG_0001.ARW\tDescription",
+        "IMG_0002.ARW\t" + "x" * (csv.field_size_limit() + 1),
+    ]
+    with pytest.raises(ValueError):
+        process_tsv_input(input)
+    output = capsys.readouterr()
+    assert "Error parsing line 2" in output.err
+
+
 def test_input_abort_on_duplicate_file_stems():
     """Abort on duplicate (ambiguous) file stems"""
     input = [
@@ -1,6 +1,10 @@
 import hashlib
+import os
 from pathlib import Path
 import shutil
+import struct
+import subprocess
+import sys
 
 import exiftool
 import pytest
@@ -95,37 +99,48 @@ def images_template(tmp_path):
 def sample_files(tmp_path):
     template_src_dir = Path(__file__).parent / "fixtures" / "sample-files"
     template_instance_dir = tmp_path / "sample-files"
+    if sys.platform == "darwin":
+        # Clone files with clonefile(2) on APFS, rather than copying them
+        try:
+            subprocess.run(
+                ["cp", "-c", "-R", template_src_dir, template_instance_dir],
+                check=True,
+                capture_output=True,
+            )
+            return template_instance_dir
+        except subprocess.CalledProcessError:
+            shutil.rmtree(template_instance_dir, ignore_errors=True)
     shutil.copytree(template_src_dir, template_instance_dir)
     return template_instance_dir
 
 
-def make_snapshot(root: Path):
-    """Make a quick snapshot of a directory tree for comparison
-
-    Returns a dict with file paths as keys, and modtime + size tuples as
-    values
+def walk_snapshot(root, dir_path=None):
+    """Recursively yield (relative path, modtime, size) for every file and
+    directory under root, using os.scandir
     """
-    snapshot = {}
-    for p in root.rglob("*"):
-        stat = p.stat()
-        rel_path = str(p.relative_to(root))
-        snapshot[rel_path] = (stat.st_mtime_ns, stat.st_size)
-    return snapshot
-
-
-def get_snapshot_hash(snapshot: dict):
-    """Compute a single hash from the given directory tree snapshot for
-    comparison
+    with os.scandir(dir_path or root) as entries:
+        for entry in entries:
+            stat = entry.stat(follow_symlinks=False)
+            yield (
+                os.path.relpath(entry.path, root),
+                stat.st_mtime_ns,
+                stat.st_size,
+            )
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_snapshot(root, entry.path)
+
+
+def snapshot_hash(root: Path):
+    """Compute a single hash of a directory tree for comparison
+
+    Walks the tree once and hashes every path with its modtime and size
     """
-    # Create a hash object
-    h = hashlib.sha256()
-    for path in sorted(snapshot):
-        mtime, size = snapshot[path]
-        # Feed it bytes as many times as you need
-        h.update(path.encode("utf-8"))
-        h.update(str(mtime).encode())
-        h.update(str(size).encode())
-        # Ask it for the current hex digest at any time
+    # Only compared for equality within a test, so use a fast, short digest
+    h = hashlib.blake2b(digest_size=16)
+    for path, mtime, size in sorted(walk_snapshot(root)):
+        # One fixed layout record per entry: modtime, size, then the
+        # NUL-terminated path
+        h.update(struct.pack("<QQ", mtime, size) + path.encode() + b"\0")
     return h.hexdigest()
 
 
@@ -177,16 +192,14 @@ def test_dry_run(images_template, sample_files):
         "07_xmp_existing_ne_desc",
     ]
     test_images = {k: v for k, v in images_template.items() if k in test_keys}
-    snapshot_orig = make_snapshot(sample_files)
-    snapshot_orig_hash = get_snapshot_hash(snapshot_orig)
+    snapshot_orig_hash = snapshot_hash(sample_files)
     files_updated_int = write_descriptions(
         test_images,
         dry_run=True,
         overwrite_descriptions=False,
         overwrite_originals=False,
     )
-    snapshot_new = make_snapshot(sample_files)
-    snapshot_new_hash = get_snapshot_hash(snapshot_new)
+    snapshot_new_hash = snapshot_hash(sample_files)
     assert files_updated_int == 0
     assert snapshot_new_hash == snapshot_orig_hash
 
@@ -206,12 +219,13 @@ def test_write_to_files_with_no_desc(images_template, sample_files, test_key):
         existing_desc = tags_result[0]
         assert all(desc == "" for desc in existing_desc.values())
 
-        # Write description
+        # Write description, sharing this test's exiftool process
         write_descriptions(
             test_image,
             dry_run=False,
             overwrite_descriptions=False,
             overwrite_originals=False,
+            et=et,
         )
 
         # Description after
@@ -230,8 +244,7 @@ def test_always_skip_matching_desc(images_template, sample_files, capsys):
     test_key = "06_xmp_existing_eq_desc"
     test_image = {}
     test_image[test_key] = images_template[test_key]
-    snapshot_orig = make_snapshot(sample_files)
-    snapshot_orig_hash = get_snapshot_hash(snapshot_orig)
+    snapshot_orig_hash = snapshot_hash(sample_files)
     write_descriptions(
         test_image,
         dry_run=False,
@@ -239,8 +252,7 @@ def test_always_skip_matching_desc(images_template, sample_files, capsys):
         overwrite_originals=False,
     )
     # No filesystem changes when overwrite_descriptions=False
-    snapshot_new = make_snapshot(sample_files)
-    snapshot_new_hash = get_snapshot_hash(snapshot_new)
+    snapshot_new_hash = snapshot_hash(sample_files)
     assert snapshot_new_hash == snapshot_orig_hash
     write_descriptions(
         test_image,
@@ -249,8 +261,7 @@ def test_always_skip_matching_desc(images_template, sample_files, capsys):
         overwrite_originals=False,
     )
     # No filesystem changes still, when overwrite_descriptions=True
-    snapshot_new = make_snapshot(sample_files)
-    snapshot_new_hash = get_snapshot_hash(snapshot_new)
+    snapshot_new_hash = snapshot_hash(sample_files)
     assert snapshot_new_hash == snapshot_orig_hash
     # Notification of skipping file
     output = capsys.readouterr()
@@ -272,16 +283,14 @@ def test_nonmatching_desc(
     """
     test_image = {}
     test_image[test_key] = images_template[test_key]
-    snapshot_orig = make_snapshot(sample_files)
-    snapshot_orig_hash = get_snapshot_hash(snapshot_orig)
+    snapshot_orig_hash = snapshot_hash(sample_files)
     write_descriptions(
         test_image,
         dry_run=False,
         overwrite_descriptions=test_overwrite_desc_val,
         overwrite_originals=False,
     )
-    snapshot_new = make_snapshot(sample_files)
-    snapshot_new_hash = get_snapshot_hash(snapshot_new)
+    snapshot_new_hash = snapshot_hash(sample_files)
     output = capsys.readouterr()
     test_image_name = test_image[test_key].found_file_path.name
     if not test_overwrite_desc_val:
@@ -355,19 +364,51 @@ def test_exiftool_write_error(images_template, capsys):
     assert f"Error writing description for {test_image_path}" in output.out
 
 
+def test_exiftool_write_error_before_last_file(
+    images_template, sample_files, capsys
+):
+    """Confirm errors are caught for any file in a batch, not just the last
+
+    exiftool only returns the exit status of the last file written
+    """
+    error_key = "08_error_file"
+    valid_key = "04_jpg_no_desc"
+    test_images = {}
+    test_images[error_key] = images_template[error_key]
+    test_images[valid_key] = images_template[valid_key]
+    with pytest.raises(exiftool.exceptions.ExifToolExecuteError):
+        write_descriptions(
+            test_images,
+            dry_run=False,
+            overwrite_descriptions=False,
+            overwrite_originals=False,
+        )
+    output = capsys.readouterr()
+    error_path = test_images[error_key].found_file_path
+    valid_path = test_images[valid_key].found_file_path
+    assert f"Error writing description for {error_path}" in output.out
+    assert f"Error writing description for {valid_path}" not in output.out
+    assert "{ready" not in output.out
+
+    # The valid file was still written
+    with exiftool.ExifToolHelper() as et:
+        tags_result = et.get_tags(valid_path, "description")
+    assert (
+        tags_result[0]["XMP:Description"] == test_images[valid_key].input_desc
+    )
+
+
 def test_skip_entries_with_no_file_found(images_template, sample_files):
     """Confirm Image objects with no matching files found are skipped"""
     test_key = "09_no_matching_file"
     test_image = {}
     test_image[test_key] = images_template[test_key]
-    snapshot_orig = make_snapshot(sample_files)
-    snapshot_orig_hash = get_snapshot_hash(snapshot_orig)
+    snapshot_orig_hash = snapshot_hash(sample_files)
     write_descriptions(
         test_image,
         dry_run=False,
         overwrite_descriptions=False,
         overwrite_originals=False,
     )
-    snapshot_new = make_snapshot(sample_files)
-    snapshot_new_hash = get_snapshot_hash(snapshot_new)
+    snapshot_new_hash = snapshot_hash(sample_files)
     assert snapshot_new_hash == snapshot_orig_hash
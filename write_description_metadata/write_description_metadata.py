@@ -6,9 +6,16 @@ Created 2025-06-25
 Write descriptions (e.g. alt text) to image metadata description fields.
 """
 
-from collections.abc import Mapping
+import contextlib
+import csv
+from collections import defaultdict, deque
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+import os
 from pathlib import Path
+import tempfile
+import threading
 
 import click
 import exiftool
@@ -29,9 +36,9 @@ __all__ = [
 ]
 
 
-XMP_TYPES: set = {".xmp"}
-RAW_TYPES: set = {".arw", ".cr2", ".dng", ".raf", ".nef"}
-JPG_TYPES: set = {".jpg", ".jpeg", ".heic"}
+XMP_TYPES: frozenset = frozenset({".xmp"})
+RAW_TYPES: frozenset = frozenset({".arw", ".cr2", ".dng", ".raf", ".nef"})
+JPG_TYPES: frozenset = frozenset({".jpg", ".jpeg", ".heic"})
 ALL_AVAILABLE_TYPES = XMP_TYPES | RAW_TYPES | JPG_TYPES
 TYPE_PRIORITIES: dict = {
     **{ext: 3 for ext in XMP_TYPES},
@@ -39,8 +46,29 @@ TYPE_PRIORITIES: dict = {
     **{ext: 1 for ext in JPG_TYPES},
 }
 
+# What select_preferred_path does for each (current, new) priority pair. A
+# current priority of 0 means no file has been found yet.
+PRIORITY_ACTIONS: dict = {
+    # First file found
+    (0, 1): "found",
+    (0, 2): "found",
+    (0, 3): "found",
+    # Two files of the same type set
+    (1, 1): "same_rank",
+    (2, 2): "same_rank",
+    (3, 3): "same_rank",
+    # More than one file found, and one of them is jpg type
+    (1, 2): "mixed_jpg",
+    (1, 3): "mixed_jpg",
+    (2, 1): "mixed_jpg",
+    (3, 1): "mixed_jpg",
+    # Prioritize between xmp and raw
+    (2, 3): "replace",
+    (3, 2): "keep",
+}
+
 
-@dataclass
+@dataclass(slots=True)
 class Image:
     line_no: int
     input_file_path: Path
@@ -48,27 +76,66 @@ class Image:
     found_file_path: Path | None = None
 
 
-def process_tsv_input(input_descriptions: list[str]) -> Mapping[str, Image]:
+def _read_tsv_rows(input_descriptions):
+    """Yield the list of fields for each line of tsv input"""
+    # Tabs only. Quote characters are part of the filename or description.
+    reader = csv.reader(
+        input_descriptions, delimiter="\t", quoting=csv.QUOTE_NONE
+    )
+    try:
+        yield from reader
+    except csv.Error as e:
+        # e.g. a field over csv.field_size_limit()
+        click.secho(
+            f"Error parsing line {reader.line_num}: {e}",
+            fg="red",
+            err=True,
+        )
+        raise ValueError(f"Error parsing line {reader.line_num}") from e
+
+
+def _strip_row(row: list[str]) -> list[str]:
+    """Trim whitespace from both ends of a row, like str.strip() on the line
+
+    Whitespace only fields at either end are dropped, since tabs are
+    whitespace too. So a row with an empty filename or description comes back
+    with one field, and fails to unpack like any other one column row.
+    """
+    start, end = 0, len(row)
+    while start < end and not row[start].strip():
+        start += 1
+    while end > start and not row[end - 1].strip():
+        end -= 1
+    row = row[start:end]
+    if row:
+        row[0] = row[0].lstrip()
+        row[-1] = row[-1].rstrip()
+    return row
+
+
+def process_tsv_input(
+    input_descriptions: Iterable[str],
+) -> Mapping[str, Image]:
     """Parse incoming filenames and descripions. Check for basic errors.
 
     Returns a dict with filename stems as keys and Image classes as values.
     """
     images = dict()
-    seen_stems = set()
-    seen_dup_stems = set()
-    duplicates = list()
+    stem_occurrences = defaultdict(list)
 
-    for line_no, line in enumerate(input_descriptions, start=1):
+    for line_no, row in enumerate(_read_tsv_rows(input_descriptions), start=1):
+        fields = _strip_row(row)
         # Skip empty lines
-        if not line.strip():
+        if not fields:
             continue
 
         # Abort if a line can't be parsed
         try:
-            input_file_str, input_desc = line.strip().split("\t")
+            input_file_str, input_desc = fields
             input_file_path = Path(input_file_str)
             file_stem = input_file_path.stem
         except ValueError:
+            line = "\t".join(row)
             click.secho(
                 (f"Error parsing line {line_no}: {line}"),
                 fg="red",
@@ -76,44 +143,31 @@ def process_tsv_input(input_descriptions: list[str]) -> Mapping[str, Image]:
             )
             raise
 
-        # Check for and collect duplicates based on file stem
-        if file_stem not in seen_stems:
-            seen_stems.add(file_stem)
-        else:
-            # We have a duplicate
-            if file_stem not in seen_dup_stems:
-                seen_dup_stems.add(file_stem)
-                # This is the first duplicate, meaning the second occurrence,
-                # add the first
-                first_occurrence = images[file_stem]
-                duplicates.append(
-                    {
-                        "line_no": first_occurrence.line_no,
-                        "input_file_path": first_occurrence.input_file_path,
-                    }
-                )
-            duplicates.append(
-                {"line_no": line_no, "input_file_path": input_file_path}
-            )
+        # Collect every occurrence of each file stem to check for duplicates
+        stem_occurrences[file_stem].append((line_no, input_file_path))
 
         new_image = Image(
             line_no=line_no,
-            input_file_path=Path(input_file_path),
+            input_file_path=input_file_path,
             input_desc=input_desc,
         )
         images[file_stem] = new_image
 
     # Abort if duplicate file stems were found.
+    duplicates = [
+        occurrence
+        for occurrences in stem_occurrences.values()
+        if len(occurrences) > 1
+        for occurrence in occurrences
+    ]
     if duplicates:
         click.secho(
             "Duplicate file stems found for the following filenames:",
             fg="red",
             err=True,
         )
-        for d in duplicates:
-            click.secho(
-                f"  {d['line_no']}: {d['input_file_path']}", fg="red", err=True
-            )
+        for line_no, input_file_path in duplicates:
+            click.secho(f"  {line_no}: {input_file_path}", fg="red", err=True)
         click.secho(
             "Filenames, excluding file type, must be unique.",
             fg="red",
@@ -130,59 +184,44 @@ def select_preferred_path(cur_path: Path | None, new_path: Path) -> Path:
     - Prioritize XMP > RAW_TYPES
     - Abort if both a JPG type and any RAW/XMP type is found
     """
-    # Check that new_path is an available type. We should never get to this
-    # code path if the file search function is working correctly.
-    if new_path.suffix.lower() not in ALL_AVAILABLE_TYPES:
+    # Look up file type priorities, with 0 for no current path. Only the
+    # available types have one, so this also checks that new_path is an
+    # available type. We should never get to this code path if the file search
+    # function is working correctly.
+    new_path_priority = TYPE_PRIORITIES.get(new_path.suffix.lower())
+    if new_path_priority is None:
         raise ValueError(f"Unavailable file type: {new_path}")
-
-    # Check that we're not comparing two files in the same type set. We should
-    # never get to this code path if the file search function is working
-    # correctly.
-    if cur_path and new_path:
-        combined_suffix_set = {
-            cur_path.suffix.lower(),
-            new_path.suffix.lower(),
-        }
-        if (
-            combined_suffix_set.issubset(RAW_TYPES)
-            or combined_suffix_set.issubset(JPG_TYPES)
-            or combined_suffix_set.issubset(XMP_TYPES)
-        ):
-            raise ValueError(
-                (
-                    "Comparing two files of same rank:\n  "
-                    f"{cur_path}\n  {new_path}"
-                )
-            )
-
-    # Look up file type priorities
     if cur_path is not None:
         cur_path_priority = TYPE_PRIORITIES[cur_path.suffix.lower()]
     else:
         cur_path_priority = 0
-    new_path_priority = TYPE_PRIORITIES[new_path.suffix.lower()]
-
-    # First file found
-    if cur_path_priority == 0:
-        click.echo(f"Found {new_path.stem} -> {new_path}")
-        return new_path
-    # More than one file found, and one of them is jpg type
-    if cur_path_priority == 1 or new_path_priority == 1:
-        click.secho(
-            (
-                f"Found both a jpg type and raw/xmp type for {new_path.stem}, "
-                f"will not write to both:\n  {cur_path}\n  {new_path}"
-            ),
-            fg="red",
-            err=True,
-        )
-        raise SystemExit(1)
-    # Prioritize between xmp and raw
-    if new_path_priority > cur_path_priority:
-        click.echo(f"Updating {new_path.stem} -> {new_path}")
-        return new_path
 
-    return cur_path
+    match PRIORITY_ACTIONS[(cur_path_priority, new_path_priority)]:
+        case "same_rank":
+            # Two files in the same type set. We should never get to this
+            # code path if the file search function is working correctly.
+            raise ValueError(
+                f"Comparing two files of same rank:\n  {cur_path}\n  {new_path}"
+            )
+        case "found":
+            click.echo(f"Found {new_path.stem} -> {new_path}")
+            return new_path
+        case "mixed_jpg":
+            click.secho(
+                (
+                    f"Found both a jpg type and raw/xmp type for "
+                    f"{new_path.stem}, will not write to both:\n  "
+                    f"{cur_path}\n  {new_path}"
+                ),
+                fg="red",
+                err=True,
+            )
+            raise SystemExit(1)
+        case "replace":
+            click.echo(f"Updating {new_path.stem} -> {new_path}")
+            return new_path
+        case "keep":
+            return cur_path
 
 
 def find_matching_files(
@@ -196,54 +235,129 @@ def find_matching_files(
     - Ignore CaptureOne/ directories
     - Filter for only the available image types
     - Abort after checking max_scan_items. We probably didn't mean to search a
-      directory tree that large.
+      directory tree that large. Duplicate or mixed type files among those
+      already scanned are reported first.
     """
-    scanned = 0
+    # Nothing to match. Any other early exit would skip the duplicate and mixed
+    # type checks in select_preferred_path, which need to see every file.
+    if not images:
+        return images
+
     ignore_dirs = {"CaptureOne"}
 
-    # Be careful not to mutate ALL_AVAILABLE_TYPES using regular = assignment,
-    # or -= mutation in place
-    file_type_filter = set(ALL_AVAILABLE_TYPES)
+    # The type sets are frozen, so the filter can't mutate them
+    file_type_filter = ALL_AVAILABLE_TYPES
     if ignore_jpg:
         file_type_filter = ALL_AVAILABLE_TYPES - JPG_TYPES
 
-    for (
-        current_dir,
-        subdirs,
-        files,
-    ) in search_dir.walk():
-        # Prune excluded subdirs in place
-        subdirs[:] = [d for d in subdirs if d not in ignore_dirs]
-
-        for file in files:
-            file = Path(file)
-            # scanned counter should increment whether files are a match or not
-            scanned += 1
-            if scanned > max_scan_items:
-                click.secho(
-                    f"Aborted after scanning {max_scan_items} files.",
-                    fg="red",
-                    err=True,
-                )
-                raise SystemExit(1)
-            if file.suffix.lower() not in file_type_filter:
-                print(f"Skipping unavailable type {file}")
-                continue
-            if file.stem not in images.keys():
+    # Shared by the scanning threads
+    scanned = 0
+    scanned_lock = threading.Lock()
+    limit_reached = threading.Event()
+
+    def scan_tree(top_dir: Path, recurse: bool) -> list[tuple[Image, Path]]:
+        """Walk a directory tree and return (image, path) for matching files
+
+        Walks with os.scandir, whose entries already know whether they're
+        directories, so no extra stat call is needed per entry.
+        """
+        nonlocal scanned
+        matches = []
+        pending_dirs = deque([top_dir])
+        while pending_dirs and not limit_reached.is_set():
+            current_dir = pending_dirs.popleft()
+            try:
+                with os.scandir(current_dir) as it:
+                    entries = list(it)
+            except OSError:
+                # Unreadable directories are skipped, same as Path.walk()
                 continue
 
-            # Found a file from the input list
-            cur_path = images[file.stem].found_file_path
-            new_path = current_dir / file.name
-            images[file.stem].found_file_path = select_preferred_path(
-                cur_path, new_path
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    # Prune excluded subdirs
+                    if recurse and entry.name not in ignore_dirs:
+                        pending_dirs.append(current_dir / entry.name)
+                    continue
+
+                # scanned counter should increment whether files are a match
+                # or not
+                with scanned_lock:
+                    scanned += 1
+                    if scanned > max_scan_items:
+                        limit_reached.set()
+                if limit_reached.is_set():
+                    return matches
+                # Split the name as a plain string. A Path is only built for
+                # matching files.
+                stem, suffix = os.path.splitext(entry.name)
+                if suffix.lower() not in file_type_filter:
+                    print(f"Skipping unavailable type {entry.name}")
+                    continue
+                image = images.get(stem)
+                if image is None:
+                    continue
+                matches.append((image, current_dir / entry.name))
+        return matches
+
+    # Scanning is mostly waiting on the filesystem, so scan each top level
+    # subdirectory in its own thread. Files directly in search_dir are scanned
+    # by their own, non-recursive task.
+    try:
+        with os.scandir(search_dir) as it:
+            top_subdirs = [
+                search_dir / entry.name
+                for entry in it
+                if entry.is_dir(follow_symlinks=False)
+                and entry.name not in ignore_dirs
+            ]
+    except OSError:
+        top_subdirs = []
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = [executor.submit(scan_tree, search_dir, recurse=False)]
+        futures.extend(
+            executor.submit(scan_tree, subdir, recurse=True)
+            for subdir in top_subdirs
+        )
+        # Collect results in submission order, so matches are merged the same
+        # way on every run
+        results = [future.result() for future in futures]
+
+    # Found files from the input list. Merged before checking the scan limit,
+    # so a conflict among the files scanned so far is reported rather than
+    # the generic abort, as when files were checked as they were scanned.
+    for matches in results:
+        for image, new_path in matches:
+            image.found_file_path = select_preferred_path(
+                image.found_file_path, new_path
             )
 
+    if limit_reached.is_set():
+        click.secho(
+            f"Aborted after scanning {max_scan_items} files.",
+            fg="red",
+            err=True,
+        )
+        raise SystemExit(1)
+
     return images
 
 
+def _list_dir_lower(dir_path: Path) -> set[str]:
+    """Return the lowercased names of files in dir_path
+
+    Subdirectories are left out, so they aren't mistaken for XMP files. Returns
+    nothing if dir_path is missing, not a directory, or unreadable.
+    """
+    try:
+        with os.scandir(dir_path) as entries:
+            return {e.name.lower() for e in entries if e.is_file()}
+    except OSError:
+        return set()
+
+
 def write_descriptions(
-    images, dry_run, overwrite_descriptions, overwrite_originals
+    images, dry_run, overwrite_descriptions, overwrite_originals, et=None
 ) -> int:
     """Write descriptions to files
 
@@ -263,9 +377,37 @@ def write_descriptions(
     the raw file that is "masked" by the xmp file. Even if an xmp has no
     description field, applications that are xmp-first will display nothing for
     the caption/description fields, despite the raw file itself having one.
+
+    Pass an already running ExifToolHelper as et to share one exiftool process
+    with the caller. Otherwise one is started for this call.
     """
-    with exiftool.ExifToolHelper() as et:
+    if et is None:
+        et_context = exiftool.ExifToolHelper()
+    else:
+        et_context = contextlib.nullcontext(et)
+    with et_context as et:
+        # Read existing descriptions for all target files with one exiftool
+        # call, rather than one call per file
+        existing_descs = {}
+        read_targets = [
+            image.found_file_path
+            for image in images.values()
+            if image.found_file_path is not None
+            and image.found_file_path.is_file()
+        ]
+        if read_targets:
+            # Results come back in the order of the files given. Pair them up
+            # rather than trusting exiftool's SourceFile to match our paths.
+            tags_results = et.get_tags(read_targets, "description")
+            for target_file, tags_result in zip(
+                read_targets, tags_results, strict=True
+            ):
+                tags_result.pop("SourceFile", None)
+                existing_descs[target_file] = tags_result
+
         files_updated = 0
+        pending_writes = []  # (target_file, et_params, desc) tuples
+        dir_listings = {}  # Lowercased filenames in raw files' directories
         for image in images.values():
             et_params = []  # Build a parameter list as we check conditions
             if overwrite_originals:
@@ -273,15 +415,21 @@ def write_descriptions(
             target_file = image.found_file_path
             if target_file is None:
                 continue
+            target_name = target_file.name
 
             # Create xmp if target_file is a raw type
             if target_file.suffix.lower() in RAW_TYPES:
-                # Check one last time that there isn't an xmp file
-                assert not (
-                    target_file.with_suffix(".xmp").is_file()
-                    or target_file.with_suffix(".XMP").is_file()
+                # Check one last time that there isn't an xmp file. Each
+                # directory is listed once, rather than checking each raw file
+                # for both .xmp and .XMP.
+                target_dir = target_file.parent
+                if target_dir not in dir_listings:
+                    dir_listings[target_dir] = _list_dir_lower(target_dir)
+                assert (
+                    f"{target_file.stem.lower()}.xmp"
+                    not in dir_listings[target_dir]
                 ), (
-                    f"Target file {target_file.name} has XMP that was "
+                    f"Target file {target_name} has XMP that was "
                     "missed during file scan."
                 )
                 # Create an xmp file, copying over the raw file's metadata
@@ -293,7 +441,7 @@ def write_descriptions(
                 # will delete the raw file after creating the XMP.
                 et_params.extend(["-out", target_file.with_suffix(".XMP")])
                 click.secho(
-                    f"Creating XMP file for {image.found_file_path.name}",
+                    f"Creating XMP file for {target_name}",
                     fg="yellow",
                 )
 
@@ -301,50 +449,101 @@ def write_descriptions(
             # This is kind of ugly, but we need some heuristics since we don't
             # know the exact dictionary key that will be returned for
             # "Description"
-            if target_file.is_file():
-                tags_result = et.get_tags(target_file, "description")
-                del tags_result[0]["SourceFile"]
-                existing_desc = tags_result[0]
+            existing_desc = existing_descs.get(target_file)
+            if existing_desc is not None:
                 # Empty description fields are empty strings. No description
                 # fields is dict.values([]). Both are covered by this
                 # conditional.
                 if not all(c == "" for c in existing_desc.values()):
-                    if list(existing_desc.values())[0] == image.input_desc:
+                    first_desc = next(iter(existing_desc.values()), "")
+                    if first_desc == image.input_desc:
                         click.secho(
-                            f"Skipping {image.found_file_path.name} "
+                            f"Skipping {target_name} "
                             "- matching description already exists"
                         )
                         continue
                     if not overwrite_descriptions:
                         click.secho(
-                            f"Skipping {image.found_file_path.name} "
+                            f"Skipping {target_name} "
                             "- a nonmatching description already exists"
                         )
                         continue
                     click.secho(
-                        "Overwriting existing description for "
-                        f"{image.found_file_path.name}",
+                        f"Overwriting existing description for {target_name}",
                         fg="yellow",
                     )
 
-            # Execute
+            # Queue the write. All writes are executed together below.
             if not dry_run:
-                try:
-                    result = et.set_tags(
-                        target_file,
-                        {"Description": image.input_desc},
-                        params=et_params,
-                    )
-                    click.secho(f"{result.strip()}")
-                    files_updated += 1
-                except:
-                    click.secho(f"Error writing description for {target_file}")
-                    click.secho(f"{et.last_status=}", fg="red")
-                    click.secho(f"{et.last_stderr=}", fg="red")
-                    raise
+                pending_writes.append(
+                    (target_file, et_params, image.input_desc)
+                )
+
+        # Execute
+        if pending_writes:
+            files_updated += _write_pending(et, pending_writes)
         return files_updated
 
 
+def _write_pending(et, pending_writes) -> int:
+    """Write all queued descriptions with a single exiftool command
+
+    Each file gets its own block of arguments in an argfile, separated by
+    -execute. exiftool only returns the exit status of the last block, so every
+    block also lists files giving errors in an error file (-efile).
+
+    Returns the number of files written. Raises ExifToolExecuteError if any
+    file couldn't be written.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        argfile_path = Path(tmp_dir) / "write_descriptions.args"
+        errfile_path = Path(tmp_dir) / "errors.txt"
+        with argfile_path.open("w", encoding="utf-8") as argfile:
+            for i, (target_file, et_params, desc) in enumerate(pending_writes):
+                if i > 0:
+                    argfile.write("-execute\n")
+                params = [
+                    *et_params,
+                    "-efile",
+                    errfile_path,
+                    f"-Description={desc}",
+                    target_file,
+                ]
+                argfile.writelines(f"{p}\n" for p in params)
+
+        try:
+            result = et.execute("-@", argfile_path)
+            execute_error = None
+        except exiftool.exceptions.ExifToolExecuteError as e:
+            result = e.stdout
+            execute_error = e
+        # In stay_open mode, exiftool prints {ready} after each inner -execute
+        result = "\n".join(
+            line for line in result.splitlines() if line != "{ready}"
+        )
+        click.secho(f"{result.strip()}")
+
+        error_files = set()
+        if errfile_path.is_file():
+            errfile_text = errfile_path.read_text(encoding="utf-8")
+            error_files = {Path(line) for line in errfile_text.splitlines()}
+
+    if execute_error or error_files:
+        failed_files = [t for t, _, _ in pending_writes if t in error_files]
+        # If exiftool didn't name the failed file, any of them could be it
+        for target_file in failed_files or [t for t, _, _ in pending_writes]:
+            click.secho(f"Error writing description for {target_file}")
+        click.secho(f"{et.last_status=}", fg="red")
+        click.secho(f"{et.last_stderr=}", fg="red")
+        if execute_error:
+            raise execute_error
+        raise exiftool.exceptions.ExifToolExecuteError(
+            et.last_status, result, et.last_stderr, ["-@", argfile_path]
+        )
+
+    return len(pending_writes)
+
+
 @click.command()
 @click.argument("input_descriptions", type=click.File("r"))
 @click.option(
@@ -448,18 +647,16 @@ def main(
 
     click.secho("\nProcessing input descriptions...", fg="blue")
     images = process_tsv_input(input_descriptions)
-    click.echo(f"{len(images.keys())} descriptions to write")
+    click.echo(f"{len(images)} descriptions to write")
 
     click.secho("\nSearching for file paths using filename stem", fg="blue")
     images = find_matching_files(
         search_dir, images, ignore_jpg, max_scan_items
     )
-    images_found_count = len(
-        [i for i in images.values() if i.found_file_path is not None]
-    )
-    click.echo(
-        f"Found {images_found_count}/{len(images.keys())} files to update"
+    images_found_count = sum(
+        1 for i in images.values() if i.found_file_path is not None
     )
+    click.echo(f"Found {images_found_count}/{len(images)} files to update")
 
     click.secho("\nWriting descriptions...", fg="blue")
     files_updated_count = write_descriptions(